@@ -0,0 +1,268 @@
+#! /usr/bin/python3
+
+# Batch Image Resize - batchresize module
+# Copyright (c) 2016 over-engineer
+# https://github.com/over-engineer/Batch-Image-Resize
+
+import math
+import PIL.Image
+
+try:
+    import numpy
+except ImportError:
+    # the batch resize path is optional, without NumPy every image is resized by Pillow
+    numpy = None
+
+
+class ResampleFilters(object):
+    """
+    The resampling filters of Pillow (with the same definitions as its C code), so our weights match its own
+    """
+
+    @staticmethod
+    def box(x):
+        if -0.5 < x <= 0.5:
+            return 1.0
+        return 0.0
+
+    @staticmethod
+    def bilinear(x):
+        x = abs(x)
+        if x < 1.0:
+            return 1.0 - x
+        return 0.0
+
+    @staticmethod
+    def bicubic(x):
+        # Pillow uses a = -0.5
+        a = -0.5
+        x = abs(x)
+        if x < 1.0:
+            return ((a + 2.0) * x - (a + 3.0)) * x * x + 1
+        if x < 2.0:
+            return (((x - 5) * x + 8) * x - 4) * a
+        return 0.0
+
+    @staticmethod
+    def sinc(x):
+        if x == 0.0:
+            return 1.0
+        x *= math.pi
+        return math.sin(x) / x
+
+    @staticmethod
+    def lanczos(x):
+        if -3.0 <= x < 3.0:
+            return ResampleFilters.sinc(x) * ResampleFilters.sinc(x / 3)
+        return 0.0
+
+
+class BatchResizer(object):
+    """
+    Resizes a stack of images that have the same size and mode with NumPy, as a single batched operation
+
+    The resampling is separable: a weight matrix (computed once for each input size, output size and
+    filter, the same way Pillow computes its coefficients) is applied along the rows and then along
+    the columns of every image, with the result rounded to 8 bits between the two passes like Pillow
+    does. The output matches `PIL.Image.Image.resize()` (without a `reducing_gap`) within 1 level per
+    channel (within 2 levels of the premultiplied color for images with an alpha channel)
+    """
+
+    # the filters we can batch, and their support
+    filters = {
+        PIL.Image.BOX: (ResampleFilters.box, 0.5),
+        PIL.Image.BILINEAR: (ResampleFilters.bilinear, 1.0),
+        PIL.Image.BICUBIC: (ResampleFilters.bicubic, 2.0),
+        PIL.Image.LANCZOS: (ResampleFilters.lanczos, 3.0)
+    }
+
+    # the modes we can batch
+    modes = ("L", "LA", "RGB", "RGBA")
+
+    # the number of work buffers we keep (about a dozen for each batch shape)
+    max_buffers = 48
+
+    @staticmethod
+    def is_available():
+        """
+        :return: `True` if NumPy is installed, or `False` if it isn't (and we can't batch)
+        """
+
+        return numpy is not None
+
+    def can_resize(self, mode, resample):
+        """
+        Check if images with the given mode can be resized in batches with the given filter
+
+        :param mode: The mode of the images (e.g. "RGB")
+        :param resample: The resampling filter (e.g. `PIL.Image.LANCZOS`)
+        :return: `True` if we can batch them, or `False` if they have to be resized by Pillow
+        """
+
+        return self.is_available() and mode in self.modes and resample in self.filters
+
+    def get_weights(self, in_size, out_size, resample, box=None):
+        """
+        Get the (out_size, in_size) weight matrix that resamples a row (or a column) of pixels
+
+        The matrices are cached, so they are only computed once for each size and filter
+
+        :param in_size: The number of input pixels
+        :param out_size: The number of output pixels
+        :param resample: The resampling filter
+        :param box: The (start, end) of the input region to resample (default is the whole row)
+        :return: The `numpy.ndarray` of the weights (float32)
+        """
+
+        if box is None:
+            box = (0, in_size)
+
+        key = (in_size, out_size, resample, box)
+        weights = self.weights_cache.get(key)
+        if weights is not None:
+            return weights
+
+        resample_filter, support = self.filters[resample]
+        scale = (box[1] - box[0]) / out_size
+        filterscale = max(scale, 1.0)
+        support *= filterscale
+
+        weights = numpy.zeros((out_size, in_size), dtype=numpy.float32)
+        for xx in range(out_size):
+            center = box[0] + (xx + 0.5) * scale
+            xmin = max(int(center - support + 0.5), 0)
+            xmax = min(int(center + support + 0.5), in_size)
+            k = [resample_filter((x - center + 0.5) / filterscale) for x in range(xmin, xmax)]
+            total = sum(k)
+            if total != 0.0:
+                k = [w / total for w in k]
+            weights[xx, xmin:xmax] = k
+
+        self.weights_cache[key] = weights
+        return weights
+
+    @staticmethod
+    def round_to_8bit(pixels):
+        """
+        Round float pixels and clip them to the 0-255 range (in place, they stay float)
+
+        :param pixels: The `numpy.ndarray` of float pixels
+        :return: The same `numpy.ndarray`
+        """
+
+        numpy.rint(pixels, out=pixels)
+        return numpy.clip(pixels, 0, 255, out=pixels)
+
+    def get_buffer(self, name, shape, dtype):
+        """
+        Get a work buffer of the given shape and type, reusing the one of the previous batch if it has the
+        same shape (so a run of batches of the same size and mode doesn't allocate any new arrays)
+
+        :param name: The name of the buffer (e.g. "rows")
+        :param shape: The shape of the buffer
+        :param dtype: The type of the buffer
+        :return: The `numpy.ndarray` (with the content of its last use)
+        """
+
+        key = (name, shape, dtype)
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            # only keep the buffers of the last few shapes
+            if len(self.buffers) >= self.max_buffers:
+                self.buffers.clear()
+            buffer = self.buffers[key] = numpy.empty(shape, dtype=dtype)
+
+        return buffer
+
+    def resize(self, pixels, size, resample, box=None):
+        """
+        Resize a stack of images
+
+        The result is a view of a work buffer, so it's overwritten by the next call
+
+        :param pixels: A (number of images, height, width, bands) uint8 `numpy.ndarray`
+        :param size: The (width, height) to resize to
+        :param resample: The resampling filter
+        :param box: The (left, top, right, bottom) region of the images to resample (default is the whole image)
+        :return: The (number of images, new height, new width, bands) uint8 `numpy.ndarray`
+        """
+
+        count, in_height, in_width, bands = pixels.shape
+        out_width, out_height = size
+        if box is None:
+            box = (0, 0, in_width, in_height)
+
+        # the bands go before the width, so each row of a band is contiguous
+        work = self.get_buffer("input", (count, in_height, bands, in_width), numpy.float32)
+        numpy.copyto(work, pixels.transpose(0, 1, 3, 2))
+
+        # like Pillow, we resample images with an alpha channel with premultiplied alpha
+        has_alpha = bands in (2, 4)
+        if has_alpha:
+            # the alpha is scaled to 0-1 in place, and rounded back to 0-255 with the colors
+            work[:, :, -1:] *= 1 / 255
+            work[:, :, :-1] *= work[:, :, -1:]
+            work[:, :, -1:] *= 255
+            self.round_to_8bit(work)
+
+        # resample the rows, as one (count * height * bands, width) @ (width, new width) product
+        weights_x = self.get_weights(in_width, out_width, resample, (box[0], box[2]))
+        rows = self.get_buffer("rows", (count * in_height * bands, out_width), numpy.float32)
+        self.round_to_8bit(numpy.dot(work.reshape(-1, in_width), weights_x.T, out=rows))
+
+        # and the columns, as one (new height, height) @ (height, count * bands * new width) product
+        weights_y = self.get_weights(in_height, out_height, resample, (box[1], box[3]))
+        columns = self.get_buffer("columns", (in_height, count, bands * out_width), numpy.float32)
+        numpy.copyto(columns, rows.reshape(count, in_height, bands * out_width).transpose(1, 0, 2))
+        resized = self.get_buffer("resized", (out_height, count * bands * out_width), numpy.float32)
+        self.round_to_8bit(numpy.dot(weights_y, columns.reshape(in_height, -1), out=resized))
+        output = self.get_buffer("output", (out_height, count, bands, out_width), numpy.uint8)
+        numpy.copyto(output, resized.reshape(out_height, count, bands, out_width), casting="unsafe")
+
+        if has_alpha:
+            # un-premultiply (truncating, like Pillow), fully transparent pixels are kept as they are
+            alpha_shape = (out_height, count, 1, out_width)
+            color_shape = (out_height, count, bands - 1, out_width)
+            transparent = self.get_buffer("transparent", alpha_shape, numpy.bool_)
+            divisor = self.get_buffer("divisor", alpha_shape, numpy.uint16)
+            color = self.get_buffer("color", color_shape, numpy.uint16)
+            numpy.equal(output[:, :, -1:], 0, out=transparent)
+            numpy.maximum(output[:, :, -1:], 1, out=divisor)
+            numpy.multiply(output[:, :, :-1], 255, out=color, dtype=numpy.uint16)
+            numpy.floor_divide(color, divisor, out=color)
+            numpy.minimum(color, 255, out=color)
+            numpy.copyto(output[:, :, :-1], color, casting="unsafe", where=~transparent)
+
+        return output.transpose(1, 0, 3, 2)
+
+    def resize_images(self, imgs, size, resample, box=None):
+        """
+        Resize a list of `PIL.Image.Image` objects that have the same size and mode
+
+        :param imgs: The list of images
+        :param size: The (width, height) to resize to
+        :param resample: The resampling filter
+        :param box: The (left, top, right, bottom) region of the images to resample (default is the whole image)
+        :return: The list of resized `PIL.Image.Image` objects
+        """
+
+        mode = imgs[0].mode
+        width, height = imgs[0].size
+        bands = len(imgs[0].getbands())
+
+        # copy the raw bytes of each image in the (reused) input buffer
+        pixels = self.get_buffer("pixels", (len(imgs), height * width * bands), numpy.uint8)
+        for i, img in enumerate(imgs):
+            pixels[i] = numpy.frombuffer(img.tobytes(), dtype=numpy.uint8)
+        resized_pixels = self.resize(pixels.reshape(len(imgs), height, width, bands), size, resample, box)
+
+        resized_size = (resized_pixels.shape[2], resized_pixels.shape[1])
+        return [PIL.Image.frombytes(mode, resized_size, resized_pixel.tobytes()) for resized_pixel in resized_pixels]
+
+    def __init__(self):
+        """
+        The constructor of the BatchResizer class
+        """
+
+        self.weights_cache = {}
+        self.buffers = {}
@@ -0,0 +1,544 @@
+#! /usr/bin/python3
+
+# Batch Image Resize - benchmark
+# Copyright (c) 2016 over-engineer
+# https://github.com/over-engineer/Batch-Image-Resize
+
+import batchresize
+import imgedit
+
+import argparse
+import io
+import gc
+import json
+import os
+import platform
+import queue
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import PIL
+import PIL.Image
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where we don't report the peak RSS
+    resource = None
+
+
+class Benchmark(object):
+    # the resolutions of the generated images
+    resolutions = [(640, 480), (1920, 1080), (4000, 3000)]
+
+    # the resampling filters we can benchmark, by name
+    filters = {
+        "nearest": PIL.Image.NEAREST,
+        "bilinear": PIL.Image.BILINEAR,
+        "bicubic": PIL.Image.BICUBIC,
+        "lanczos": PIL.Image.LANCZOS
+    }
+
+    @staticmethod
+    def get_peak_rss():
+        """
+        Get the peak resident set size of this process and its (finished) child processes
+
+        :return: The peak RSS in MB, or `None` if we can't get it on this platform
+        """
+
+        if resource is None:
+            return None
+
+        peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+        # `ru_maxrss` is in bytes on macOS and in kilobytes everywhere else
+        if sys.platform == "darwin":
+            return round(peak_rss / 2 ** 20, 1)
+        return round(peak_rss / 2 ** 10, 1)
+
+    @staticmethod
+    def make_image(rnd, size, alpha):
+        """
+        Make a synthetic image (gradients and a fractal, so it compresses like a photo rather than noise)
+
+        :param rnd: The `random.Random` instance that picks the content of the image
+        :param size: The (width, height) of the image
+        :param alpha: Whether the image has an alpha channel
+        :return: The `PIL.Image.Image`
+        """
+
+        x = rnd.uniform(-2.0, -0.5)
+        y = rnd.uniform(-1.0, 0.5)
+        zoom = rnd.uniform(0.2, 1.5)
+        bands = [
+            PIL.Image.linear_gradient("L").rotate(rnd.randrange(360)).resize(size),
+            PIL.Image.radial_gradient("L").resize(size),
+            PIL.Image.effect_mandelbrot(size, (x, y, x + zoom, y + zoom), 64).convert("L")
+        ]
+        rnd.shuffle(bands)
+
+        if alpha:
+            return PIL.Image.merge("RGBA", bands + [PIL.Image.radial_gradient("L").resize(size)])
+        return PIL.Image.merge("RGB", bands)
+
+    def make_corpus(self, directory, count, seed):
+        """
+        Make a deterministic corpus of PNG and JPEG images (the same `count` and `seed` give the same images)
+
+        Every third PNG image has an alpha channel
+
+        :param directory: The directory to save the images in
+        :param count: The number of images
+        :param seed: The seed of the random generator
+        :return: A dict describing the corpus
+        """
+
+        rnd = random.Random(seed)
+        total_bytes = 0
+        for i in range(count):
+            size = self.resolutions[i % len(self.resolutions)]
+            if i % 2:
+                img = self.make_image(rnd, size, alpha=False)
+                filename = os.path.join(directory, "img%05d.jpg" % i)
+                img.save(filename, quality=90)
+            else:
+                img = self.make_image(rnd, size, alpha=i % 3 == 0)
+                filename = os.path.join(directory, "img%05d.png" % i)
+                img.save(filename)
+            total_bytes += os.path.getsize(filename)
+
+        return {
+            "count": count,
+            "seed": seed,
+            "resolutions": self.resolutions,
+            "bytes": total_bytes
+        }
+
+    @staticmethod
+    def get_gc_collections():
+        """
+        Get the number of garbage collections so far (of all generations)
+
+        :return: The number of collections
+        """
+
+        return sum(stats["collections"] for stats in gc.get_stats())
+
+    def measure_allocations(self, function):
+        """
+        Measure the memory Python (and NumPy) allocates while a function runs
+
+        :param function: The function to call (without arguments)
+        :return: A dict with the peak of the traced memory in MB and the number of garbage collections
+        """
+
+        gc.collect()
+        gc_collections = self.get_gc_collections()
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "traced_peak_mb": round(peak / 2 ** 20, 2),
+            "gc_collections": self.get_gc_collections() - gc_collections
+        }
+
+    def add_result(self, name, images, seconds, num_of_bytes, allocations=None, **params):
+        """
+        Add a timed phase to the results
+
+        :param name: The name of the phase (e.g. "decode")
+        :param images: The number of images processed
+        :param seconds: The time it took
+        :param num_of_bytes: The number of bytes processed (used for the MB/s)
+        :param allocations: The allocations of the phase (see `self.measure_allocations()`), if we measured them
+        :param params: The parameters of the phase (e.g. filter="lanczos")
+        """
+
+        result = {
+            "name": name,
+            "images": images,
+            "seconds": round(seconds, 4),
+            "images_per_sec": round(images / seconds, 2) if seconds else None,
+            "mb_per_sec": round(num_of_bytes / 2 ** 20 / seconds, 2) if seconds else None,
+            "peak_rss_mb": self.get_peak_rss()
+        }
+        result.update(allocations or {})
+        result.update(params)
+        self.results.append(result)
+
+        print("%-40s %10.2f img/s %10.2f MB/s" % (self.get_result_key(result),
+                                                  result["images_per_sec"] or 0,
+                                                  result["mb_per_sec"] or 0), file=sys.stderr)
+
+    @staticmethod
+    def get_result_key(result):
+        """
+        Get the key that identifies a result across runs
+
+        :param result: The result dict
+        :return: The key (e.g. "resize filter=lanczos")
+        """
+
+        params = sorted((key, value) for key, value in result.items()
+                        if key not in ("name", "images", "seconds", "images_per_sec", "mb_per_sec", "peak_rss_mb",
+                                       "traced_peak_mb", "gc_collections", "entries", "entries_per_sec",
+                                       "pil_loaded", "modules"))
+        return " ".join([result["name"]] + ["%s=%s" % param for param in params])
+
+    def bench_startup(self, repeat):
+        """
+        Time the startup of the GUI: a new interpreter importing `bir` (everything but showing the window,
+        which `bir.py --startup-time` measures where there is a display), the median of `repeat` runs
+
+        The images/sec of the result is the number of startups per second, and it records whether
+        Pillow was loaded and the number of modules that were
+
+        :param repeat: The number of times to start it
+        """
+
+        command = [sys.executable, "-c", "import bir, json, sys; "
+                                         "print(json.dumps({\"pil_loaded\": \"PIL.Image\" in sys.modules, "
+                                         "\"modules\": len(sys.modules)}))"]
+
+        times = []
+        for i in range(repeat):
+            start_time = time.perf_counter()
+            output = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+                                    stdout=subprocess.PIPE, universal_newlines=True).stdout
+            times.append(time.perf_counter() - start_time)
+
+        self.add_result("startup", 1, statistics.median(times), 0, **json.loads(output))
+
+    def bench_scan(self, directory):
+        """
+        Time the directory scan of `ImgEdit.scan_dir()` (the result has the number of directory entries
+        the scanner went through, and how many of them it went through per second)
+
+        :param directory: The directory of the corpus
+        :return: The list of `{"path": ..., "name": ...}` dicts of the images
+        """
+
+        images = queue.Queue()
+        img_edit = imgedit.ImgEdit()
+        img_edit.num_of_images_to_export = 0
+
+        start_time = time.perf_counter()
+        img_edit.scan_dir(directory, images)
+        self.add_result("scan", img_edit.num_of_images_to_export, time.perf_counter() - start_time, 0,
+                        entries=img_edit.scan_stats["entries"],
+                        entries_per_sec=img_edit.scan_stats["entries_per_sec"])
+
+        return list(iter(images.get, None))
+
+    def bench_phases(self, images, size, filters, formats):
+        """
+        Time the decode, resize and encode phases separately
+
+        Every image is decoded once, resized with each filter and every resized image is encoded
+        to each format (in memory, so the disk isn't part of the encode time). The MB/s is the
+        source file size for decoding, the decoded pixels for resizing and the output size for encoding
+
+        :param images: The list of `{"path": ..., "name": ...}` dicts of the images
+        :param size: The (width, height) to resize to
+        :param filters: The names of the resampling filters
+        :param formats: The output formats (e.g. ["PNG", "JPEG"])
+        """
+
+        decode_time = 0.0
+        decode_bytes = 0
+        resize_times = dict.fromkeys(filters, 0.0)
+        resize_bytes = 0
+        encode_times = dict.fromkeys(formats, 0.0)
+        encode_bytes = dict.fromkeys(formats, 0)
+
+        for img_info in images:
+            img_path = os.path.join(img_info["path"], img_info["name"])
+
+            start_time = time.perf_counter()
+            img = PIL.Image.open(img_path)
+            img.load()
+            decode_time += time.perf_counter() - start_time
+            decode_bytes += os.path.getsize(img_path)
+            resize_bytes += len(img.getbands()) * img.width * img.height
+
+            for filter_name in filters:
+                start_time = time.perf_counter()
+                resized_img = img.resize(size, self.filters[filter_name])
+                resize_times[filter_name] += time.perf_counter() - start_time
+
+                for export_type in formats:
+                    # JPEG can't store an alpha channel
+                    if export_type == "JPEG" and resized_img.mode != "RGB":
+                        resized_img = resized_img.convert("RGB")
+
+                    output = io.BytesIO()
+                    start_time = time.perf_counter()
+                    resized_img.save(output, export_type)
+                    encode_times[export_type] += time.perf_counter() - start_time
+                    encode_bytes[export_type] += output.tell()
+
+        self.add_result("decode", len(images), decode_time, decode_bytes)
+        for filter_name in filters:
+            self.add_result("resize", len(images), resize_times[filter_name], resize_bytes, filter=filter_name)
+        for export_type in formats:
+            # each format encodes one image per filter
+            self.add_result("encode", len(images) * len(filters), encode_times[export_type],
+                            encode_bytes[export_type], format=export_type)
+
+    def bench_export(self, directory, corpus, size, workers_list, formats):
+        """
+        Time `ImgEdit.export_all_in_dir()` end to end, for each worker count and output format
+
+        :param directory: The directory of the corpus
+        :param corpus: The dict describing the corpus
+        :param size: The (width, height) to resize to
+        :param workers_list: The worker counts
+        :param formats: The output formats
+        """
+
+        for workers in workers_list:
+            for export_type in formats:
+                img_edit = imgedit.ImgEdit(workers=workers)
+                q = queue.Queue()
+
+                start_time = time.perf_counter()
+                img_edit.export_all_in_dir(directory, size[0], size[1], export_type, False, q)
+                seconds = time.perf_counter() - start_time
+                q.get()
+
+                self.add_result("export", img_edit.num_of_exported_images, seconds, corpus["bytes"],
+                                format=export_type, workers=workers)
+
+                # remove the exported images, so they aren't picked up by the next run
+                for path, subdirs, files in os.walk(directory):
+                    for name in files:
+                        if "_resize." in name:
+                            os.remove(os.path.join(path, name))
+
+    def bench_batch(self, count, seed, filters, batch_size):
+        """
+        Time the batched NumPy resize (see `batchresize.BatchResizer`) against Pillow, on a corpus
+        of small images that all have the same size and mode (e.g. icons)
+
+        The resize alone is timed on the pixels, and with the conversion of the images to and from
+        NumPy arrays (for which the allocations are measured too). The end to end export is timed
+        with and without `batch_size`
+
+        :param count: The number of images
+        :param seed: The seed of the random generator
+        :param filters: The names of the resampling filters
+        :param batch_size: The batch size of the export
+        """
+
+        if not batchresize.BatchResizer.is_available():
+            return
+
+        rnd = random.Random(seed)
+        src_size, size = (64, 64), (32, 32)
+        imgs = [self.make_image(rnd, src_size, alpha=True) for i in range(count)]
+        resize_bytes = count * 4 * src_size[0] * src_size[1]
+        batch_resizer = batchresize.BatchResizer()
+
+        for filter_name in filters:
+            resample = self.filters[filter_name]
+            if not batch_resizer.can_resize("RGBA", resample):
+                continue
+
+            start_time = time.perf_counter()
+            for img in imgs:
+                img.resize(size, resample)
+            self.add_result("batch_resize", count, time.perf_counter() - start_time, resize_bytes,
+                            filter=filter_name, method="pillow")
+
+            # the export resizes `batch_size` images at a time too
+            pixels = batchresize.numpy.stack([batchresize.numpy.asarray(img) for img in imgs])
+            batch_resizer.get_weights(src_size[0], size[0], resample)
+            start_time = time.perf_counter()
+            for i in range(0, count, batch_size):
+                batch_resizer.resize(pixels[i:i + batch_size], size, resample)
+            self.add_result("batch_resize", count, time.perf_counter() - start_time, resize_bytes,
+                            filter=filter_name, method="numpy")
+
+            def resize_images():
+                for i in range(0, count, batch_size):
+                    batch_resizer.resize_images(imgs[i:i + batch_size], size, resample)
+
+            start_time = time.perf_counter()
+            resize_images()
+            seconds = time.perf_counter() - start_time
+
+            # tracing slows everything down, so the allocations are measured on a second pass
+            self.add_result("batch_resize", count, seconds, resize_bytes,
+                            allocations=self.measure_allocations(resize_images),
+                            filter=filter_name, method="numpy+convert")
+
+        directory = tempfile.mkdtemp(prefix="bir_benchmark_batch_")
+        try:
+            for i, img in enumerate(imgs):
+                img.save(os.path.join(directory, "icon%05d.png" % i))
+
+            for size_of_batch in (0, batch_size):
+                img_edit = imgedit.ImgEdit(batch_size=size_of_batch)
+                q = queue.Queue()
+
+                gc_collections = self.get_gc_collections()
+                start_time = time.perf_counter()
+                img_edit.export_all_in_dir(directory, size[0], size[1], "PNG", False, q)
+                seconds = time.perf_counter() - start_time
+                q.get()
+
+                self.add_result("batch_export", img_edit.num_of_exported_images, seconds, resize_bytes,
+                                allocations={"gc_collections": self.get_gc_collections() - gc_collections},
+                                batch_size=size_of_batch)
+
+                for name in os.listdir(directory):
+                    if "_resize." in name:
+                        os.remove(os.path.join(directory, name))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, count, seed, size, filters, formats, workers_list, batch_count=0, batch_size=64,
+            startup_repeat=0):
+        """
+        Make a corpus in a temporary directory and run all the benchmarks on it
+
+        :param count: The number of images in the corpus
+        :param seed: The seed of the corpus
+        :param size: The (width, height) to resize to
+        :param filters: The names of the resampling filters
+        :param formats: The output formats
+        :param workers_list: The worker counts for the end to end exports
+        :param batch_count: The number of small images for the batched resize benchmark (0 to skip it)
+        :param batch_size: The batch size for the batched resize benchmark
+        :param startup_repeat: The number of times the startup of the GUI is timed (0 to skip it)
+        :return: The results as a dict (that can be saved as JSON)
+        """
+
+        self.results = []
+        if startup_repeat:
+            self.bench_startup(startup_repeat)
+
+        directory = tempfile.mkdtemp(prefix="bir_benchmark_")
+        try:
+            corpus = self.make_corpus(directory, count, seed)
+            images = self.bench_scan(directory)
+            self.bench_phases(images, size, filters, formats)
+            self.bench_export(directory, corpus, size, workers_list, formats)
+            if batch_count:
+                self.bench_batch(batch_count, seed, filters, batch_size)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        return {
+            "environment": {
+                "python": platform.python_version(),
+                "pillow": PIL.__version__,
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count()
+            },
+            "corpus": corpus,
+            "size": list(size),
+            "results": self.results
+        }
+
+    def compare(self, old, new):
+        """
+        Print the images/sec of two benchmark runs side by side
+
+        :param old: The results dict of the old run
+        :param new: The results dict of the new run
+        :return: A list of (key, old images/sec, new images/sec, change in %) tuples
+        """
+
+        old_results = {self.get_result_key(result): result for result in old["results"]}
+        comparison = []
+        for result in new["results"]:
+            key = self.get_result_key(result)
+            if key not in old_results:
+                continue
+
+            old_rate = old_results[key]["images_per_sec"]
+            new_rate = result["images_per_sec"]
+            change = round((new_rate - old_rate) / old_rate * 100, 1) if old_rate and new_rate else None
+            comparison.append((key, old_rate, new_rate, change))
+            print("%-40s %10s -> %10s img/s  %s" % (key, old_rate, new_rate,
+                                                    "" if change is None else "%+.1f%%" % change))
+
+        return comparison
+
+    def __init__(self):
+        """
+        The constructor of the Benchmark class
+        """
+
+        self.results = []
+
+
+def main():
+    """
+    The main function
+    """
+
+    parser = argparse.ArgumentParser(prog="benchmark", description="Benchmark the resize pipeline")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks on a synthetic corpus")
+    run_parser.add_argument("--count", type=int, default=30, help="the number of images (default is 30)")
+    run_parser.add_argument("--seed", type=int, default=0, help="the seed of the corpus (default is 0)")
+    run_parser.add_argument("--size", default="800x600", help="the size to resize to (default is 800x600)")
+    run_parser.add_argument("--filters", default="bilinear,bicubic,lanczos",
+                            help="comma separated resampling filters (default is bilinear,bicubic,lanczos)")
+    run_parser.add_argument("--formats", default="PNG,JPEG", help="comma separated formats (default is PNG,JPEG)")
+    run_parser.add_argument("--workers", default="1,%d" % (os.cpu_count() or 1),
+                            help="comma separated worker counts (default is 1 and the number of CPUs)")
+    run_parser.add_argument("--batch-count", type=int, default=500,
+                            help="the number of small images for the batched resize benchmark (default is 500, "
+                                 "0 to skip it)")
+    run_parser.add_argument("--batch-size", type=int, default=64,
+                            help="the batch size for the batched resize benchmark (default is 64)")
+    run_parser.add_argument("--startup-repeat", type=int, default=5,
+                            help="the number of times the startup of the GUI is timed (default is 5, 0 to skip it)")
+    run_parser.add_argument("--output", help="the JSON file to save the results in (default is stdout)")
+
+    compare_parser = subparsers.add_parser("compare", help="compare the results of two runs")
+    compare_parser.add_argument("old", help="the JSON results of the old run")
+    compare_parser.add_argument("new", help="the JSON results of the new run")
+
+    args = parser.parse_args()
+    benchmark = Benchmark()
+
+    if args.command == "run":
+        width, height = args.size.lower().split("x")
+        results = benchmark.run(args.count, args.seed, (int(width), int(height)),
+                                args.filters.split(","), args.formats.upper().split(","),
+                                sorted(set(int(workers) for workers in args.workers.split(","))),
+                                args.batch_count, args.batch_size, args.startup_repeat)
+
+        if args.output is None:
+            json.dump(results, sys.stdout, indent=2)
+        else:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+    else:
+        with open(args.old, "r") as f:
+            old = json.load(f)
+        with open(args.new, "r") as f:
+            new = json.load(f)
+        benchmark.compare(old, new)
+
+
+if __name__ == "__main__":
+    main()
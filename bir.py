@@ -4,17 +4,26 @@
 # Copyright (c) 2016 over-engineer
 # https://github.com/over-engineer/Batch-Image-Resize
 
-import imgedit
+import time
 
+# when the startup began (see `--startup-time`)
+start_time = time.perf_counter()
+
+import collections
+import json
+import multiprocessing
 import os
 import queue
+import sys
 import threading
 
 from enum import Enum
+from scanner import DirectoryScanner
 from tkinter import *
 from tkinter import ttk
-from tkinter import filedialog
-from tkinter import messagebox
+
+# `imgedit` (and with it Pillow and its codecs), `filedialog` and `messagebox` are
+# imported when they are first used, so the window shows up as fast as possible
 
 
 class SettingsStatus(Enum):
@@ -31,6 +40,250 @@ class SettingsStatus(Enum):
     invalid_dimensions = 4
 
 
+class PreviewGrid(Frame):
+    """
+    A scrollable grid of the thumbnails of the images in a directory
+
+    The grid is virtualized: only the rows that are visible have items on the canvas, and only their
+    thumbnails are asked for (see `thumbnails.ThumbnailLoader`), so it stays responsive with tens of
+    thousands of images. The directory is scanned on a separate thread, and the grid fills up as it goes
+    """
+
+    # the size of a cell (the thumbnail, with the name and the size of the image under it)
+    cell_width = 104
+    cell_height = 136
+    thumbnail_size = 96
+
+    # the number of thumbnails kept in memory (a lot more than fit on the screen)
+    max_photos = 500
+
+    def set_directory(self, directory):
+        """
+        Show the images of a directory
+
+        :param directory: The path to the directory
+        """
+
+        if directory == self.directory:
+            return
+
+        if self.loader is None:
+            # imported here, so Pillow is only loaded once the preview is used
+            import thumbnails
+
+            self.loader = thumbnails.ThumbnailLoader(thumbnails.ThumbnailCache(size=(self.thumbnail_size,) * 2))
+
+        self.directory = directory
+        self.images = []
+        self.scan_id += 1
+        self.loader.clear()
+        self.clear_cells()
+        self.canvas.yview_moveto(0)
+
+        scan_thread = threading.Thread(target=self.scan, args=(directory, self.images, self.scan_id))
+        scan_thread.daemon = True
+        scan_thread.start()
+
+    def scan(self, directory, images, scan_id):
+        """
+        Find the images of a directory (runs on a separate thread)
+
+        :param directory: The path to the directory
+        :param images: The list we append a `(path, name, mtime_ns)` tuple to for each image
+        :param scan_id: The id of this scan (it stops once another directory is selected)
+        """
+
+        try:
+            for path, entry in DirectoryScanner().scan(directory):
+                if scan_id != self.scan_id:
+                    return
+                try:
+                    images.append((entry.path, entry.name, entry.stat().st_mtime_ns))
+                except OSError:
+                    pass
+        except OSError:
+            pass
+
+    def clear_cells(self):
+        """
+        Remove the items of all the cells from the canvas
+        """
+
+        self.canvas.delete("all")
+        self.cells = {}
+        self.cell_indexes = {}
+
+    def redraw(self, event=None):
+        """
+        Update the cells to the ones that are visible, and ask for the thumbnails that they are missing
+
+        :param event: the event parameter (when the canvas is resized)
+        """
+
+        columns = max(self.canvas.winfo_width() // self.cell_width, 1)
+        if columns != self.columns:
+            self.columns = columns
+            self.clear_cells()
+
+        num_of_images = len(self.images)
+        rows = -(-num_of_images // columns)
+        self.canvas.configure(scrollregion=(0, 0, columns * self.cell_width, max(rows * self.cell_height, 1)))
+
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        visible = range(min(int(top // self.cell_height) * columns, num_of_images),
+                        min((int(bottom // self.cell_height) + 1) * columns, num_of_images))
+
+        for index in [index for index in self.cells if index not in visible]:
+            self.canvas.delete(*self.cells.pop(index)[1:])
+        for index in visible:
+            if index not in self.cells:
+                self.create_cell(index)
+
+        if self.loader is None:
+            return
+
+        # the cached thumbnails are shown right away, the others once they are made
+        requested = [(self.images[index][0], self.images[index][2]) for index in visible
+                     if self.images[index][0] not in self.photos]
+        for img_path, thumbnail in self.loader.request(requested):
+            self.show_thumbnail(img_path, thumbnail)
+
+    def create_cell(self, index):
+        """
+        Add the items of a cell to the canvas
+
+        :param index: The index of the image
+        """
+
+        img_path, name, mtime_ns = self.images[index]
+        x = (index % self.columns) * self.cell_width + self.cell_width // 2
+        y = (index // self.columns) * self.cell_height + 4
+
+        image_item = self.canvas.create_image(x, y + self.thumbnail_size // 2, anchor="center")
+        text_item = self.canvas.create_text(x, y + self.thumbnail_size + 4, anchor="n", text=name,
+                                            width=self.cell_width - 8, font=("Segoe UI", 8))
+        self.cells[index] = (img_path, image_item, text_item)
+        self.cell_indexes[img_path] = index
+
+        photo = self.photos.get(img_path)
+        if photo is not None:
+            self.photos.move_to_end(img_path)
+            self.canvas.itemconfigure(image_item, image=photo[0])
+            self.canvas.itemconfigure(text_item, text="%s\n%dx%d" % ((name,) + photo[1]))
+
+    def show_thumbnail(self, img_path, thumbnail):
+        """
+        Show the thumbnail of an image, if its cell is visible
+
+        :param img_path: The path to the image
+        :param thumbnail: A `(thumbnail path, (width, height) of the image)` tuple, or `None` if the image
+                          couldn't be read
+        """
+
+        index = self.cell_indexes.get(img_path)
+        if index is None or index not in self.cells:
+            return
+
+        img_path, image_item, text_item = self.cells[index]
+        name = self.images[index][1]
+        if thumbnail is None:
+            self.canvas.itemconfigure(text_item, text=name + "\n(can't be read)")
+            return
+
+        # Tk reads the PNG files of the thumbnails itself
+        try:
+            photo = (PhotoImage(file=thumbnail[0]), thumbnail[1])
+        except TclError:
+            return
+        self.photos[img_path] = photo
+        while len(self.photos) > self.max_photos:
+            self.photos.popitem(last=False)
+
+        self.canvas.itemconfigure(image_item, image=photo[0])
+        self.canvas.itemconfigure(text_item, text="%s\n%dx%d" % ((name,) + photo[1]))
+
+    def poll(self):
+        """
+        Run @ a 50 ms interval using tkinter's `.after()` to show the thumbnails that were made,
+        and the images the scan found since the last time
+        """
+
+        # keep polling even if showing a thumbnail fails, or the grid would stop updating
+        try:
+            if self.loader is not None:
+                for img_path, thumbnail in self.loader.get_finished():
+                    self.show_thumbnail(img_path, thumbnail)
+
+                if len(self.images) != self.num_of_shown_images:
+                    self.num_of_shown_images = len(self.images)
+                    self.redraw()
+        finally:
+            self.after(50, self.poll)
+
+    def yview(self, *args):
+        """
+        Scroll the canvas (the command of the scrollbar)
+        """
+
+        self.canvas.yview(*args)
+        self.redraw()
+
+    def scroll(self, event):
+        """
+        Scroll the canvas with the mouse wheel
+
+        :param event: the event parameter
+        """
+
+        if event.num == 4 or event.delta > 0:
+            self.canvas.yview_scroll(-1, "units")
+        else:
+            self.canvas.yview_scroll(1, "units")
+        self.redraw()
+
+    def destroy(self):
+        """
+        Stop making thumbnails and destroy the widget
+        """
+
+        if self.loader is not None:
+            self.loader.close()
+        Frame.destroy(self)
+
+    def __init__(self, parent=None):
+        """
+        The constructor of the PreviewGrid class
+        """
+
+        Frame.__init__(self, parent)
+
+        self.directory = None
+        self.images = []
+        self.scan_id = 0
+        self.num_of_shown_images = 0
+        self.loader = None
+        self.columns = 0
+        self.cells = {}
+        self.cell_indexes = {}
+        self.photos = collections.OrderedDict()
+
+        # three columns fit in the window, more if it's made wider
+        self.canvas = Canvas(self, width=self.cell_width * 3, height=self.cell_height * 2 + 64, highlightthickness=0,
+                             yscrollincrement=self.cell_height // 4)
+        scrollbar = ttk.Scrollbar(self, command=self.yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", self.redraw)
+        self.canvas.bind("<MouseWheel>", self.scroll)
+        self.canvas.bind("<Button-4>", self.scroll)
+        self.canvas.bind("<Button-5>", self.scroll)
+
+        self.poll()
+
+
 class Application(Frame):
     def set_properties_defaults(self):
         """
@@ -42,6 +295,7 @@ class Application(Frame):
         self.export_properties["height"].set("height px")
         self.export_properties["type"].set("PNG")  # default export type
         self.overwrite_original.set(False)  # default is disabled
+        self.show_preview.set(False)  # default is hidden
 
     def confirm_settings(self):
         """
@@ -51,6 +305,8 @@ class Application(Frame):
                     Return `True` if we want to export, or `False` if we don't
         """
 
+        from tkinter import messagebox
+
         confirm_msg = "You are about to export with these settings:"
         confirm_msg += "\nDirectory: " + self.selected_directory.get()
         confirm_msg += "\nResize images to: " + self.export_properties["width"].get()
@@ -65,37 +321,63 @@ class Application(Frame):
 
         return messagebox.askyesno("Export confirmation", confirm_msg)
 
+    @staticmethod
+    def get_progress_text(status):
+        """
+        Get the text of the progress window for the status of an export
+
+        :param status: The status dict of the export (see `imgedit.ExportProgress.get_status()`)
+        :return: The text (e.g. "12 of 140 images, 8.3 images/s, 2.1 MB/s, 0:15 left")
+        """
+
+        text = "%d of %d images" % (status["done"], status["total"])
+        if not status["scan_finished"]:
+            text += " found so far"
+
+        if status["cancelled"]:
+            return text + ", cancelling"
+        if status["paused"]:
+            return text + ", paused"
+
+        if status["images_per_sec"] is not None:
+            text += ", %.1f images/s, %.1f MB/s" % (status["images_per_sec"], status["bytes_per_sec"] / 2 ** 20)
+        if status["eta"] is not None:
+            text += ", %d:%02d left" % divmod(int(status["eta"]), 60)
+
+        return text
+
     def exporting_interval(self, q):
         """
         Run @ a 100 ms interval using tkinter's `.after()` while the exporting thread is running
 
         In order to keep tkinter's event loop running, our image editing code runs
-        on a different thread. We look at `num_of_exported_images`, `images_to_export`
-        and the result of our `q` queue (which represents if our code failed to
-        open, resize and/or save any images) to check the status of the thread
+        on a different thread. We look at the status of its `progress` (the number of
+        images exported and found so far, while the directory is still being scanned,
+        the rates and the time left) to update the progress window, at its events for
+        the images that failed, and at our `q` queue to check if the thread is done
 
         Once everything is done, we will get the operation's result using `q.get()`
+        (which represents if our code failed to open, resize and/or save any images)
         and we will call the `self.exported()` (passing the result) to handle the rest
 
         :param q: our `Queue` instance
         """
 
-        run_the_interval = True
+        # update the progress bar and the text below it
+        status = self.img_edit.progress.get_status()
+        self.progress_bar["value"] = status["done"]
+        self.progress_bar["maximum"] = max(status["total"], 1)
+        self.progress_text.set(self.get_progress_text(status))
 
-        if self.img_edit.num_of_images_to_export is not None:
-            exported_images = self.img_edit.num_of_exported_images
-            images_to_export = self.img_edit.num_of_images_to_export
+        # show the last image that failed
+        for event in self.img_edit.progress.get_events():
+            if event["event"] == "image_failed":
+                self.failure_text.set("%s: %s" % (os.path.basename(event["path"]), event["reason"]))
 
-            # update progress bar
-            self.progress_bar["value"] = exported_images
-            self.progress_bar["maximum"] = images_to_export
-
-            # check if we are done
-            if exported_images >= images_to_export:
-                run_the_interval = False
-                self.exported(q.get())
-
-        if run_the_interval:
+        # check if we are done
+        if not q.empty():
+            self.exported(q.get())
+        else:
             self.after(100, self.exporting_interval, q)
 
     def exported(self, result):
@@ -108,14 +390,24 @@ class Application(Frame):
                         or `False` if there was an error)
         """
 
+        from tkinter import messagebox
+
         self.clear_progress_window()
 
-        if result:
+        status = self.img_edit.progress.get_status()
+        if status["cancelled"]:
+            messagebox.showinfo("Export cancelled",
+                                "The export was cancelled after %d of %d images" % (status["done"], status["total"]))
+        elif result:
             messagebox.showinfo("Exports completed",
                                 "All images were exported successfully")
         else:
+            # list the first few images that failed and why
+            failures = ["%s: %s" % (os.path.basename(path), reason) for path, reason in self.img_edit.failures[:5]]
+            if len(self.img_edit.failures) > len(failures):
+                failures.append("and %d more" % (len(self.img_edit.failures) - len(failures)))
             messagebox.showwarning("Exports failed",
-                                   "One or more images failed to export")
+                                   "\n".join(["One or more images failed to export"] + failures))
 
     def clear_progress_window(self):
         """
@@ -124,6 +416,30 @@ class Application(Frame):
 
         if self.progress_window is not None:
             self.progress_window.destroy()
+            self.progress_window = None
+
+    def cancel_export(self):
+        """
+        Cancel the export (the images that are being exported are finished first)
+        Gets called when we click the Cancel button, or close the progress window
+        """
+
+        self.img_edit.progress.cancel()
+        self.pause_button.configure(state="disabled")
+        self.cancel_button.configure(state="disabled")
+
+    def toggle_pause(self):
+        """
+        Pause or resume the export
+        Gets called when we click the Pause/Resume button
+        """
+
+        if self.img_edit.progress.get_status()["paused"]:
+            self.img_edit.progress.resume()
+            self.pause_button.configure(text="Pause")
+        else:
+            self.img_edit.progress.pause()
+            self.pause_button.configure(text="Resume")
 
     def display_progress_window(self):
         """
@@ -134,20 +450,71 @@ class Application(Frame):
 
         self.progress_window = Toplevel(self)
         self.progress_window.title("Exporting")
-        self.progress_window.geometry("300x100")
+        self.progress_window.geometry("360x170")
         self.progress_window.iconbitmap("icon.ico")
+        self.progress_window.protocol("WM_DELETE_WINDOW", self.cancel_export)
 
         Label(self.progress_window,
               text="Exporting images",
               font=("Segoe UI", 16)).pack(fill="x", side="top")
 
+        # Pause/Resume and Cancel
+        buttons = Frame(self.progress_window)
+        buttons.pack(side="bottom", pady=4)
+        self.pause_button = ttk.Button(buttons, text="Pause", command=self.toggle_pause)
+        self.pause_button.pack(side="left", padx=2)
+        self.cancel_button = ttk.Button(buttons, text="Cancel", command=self.cancel_export)
+        self.cancel_button.pack(side="left", padx=2)
+
+        # the last image that failed, the progress (with the rates and the time left) and the progress bar
+        self.failure_text.set("")
+        Label(self.progress_window, textvariable=self.failure_text, font=("Segoe UI", 8),
+              fg="red", wraplength=340).pack(fill="x", side="bottom")
+
+        self.progress_text.set("Scanning")
+        Label(self.progress_window, textvariable=self.progress_text, font=("Segoe UI", 9)).pack(
+            fill="x", side="bottom")
+
         self.progress_bar = ttk.Progressbar(self.progress_window,
                                             orient="horizontal",
-                                            length=280,
+                                            length=340,
                                             mode="determinate")
-        self.progress_bar.pack(expand=True, fill="both", side="bottom")
+        self.progress_bar.pack(expand=True, fill="both", side="bottom", padx=10)
         self.progress_bar["value"] = 0
 
+    def get_img_edit(self):
+        """
+        Get our `ImgEdit` instance, importing `imgedit` and creating it the first time we export
+
+        :return: The `imgedit.ImgEdit` instance
+        """
+
+        if self.img_edit is None:
+            import imgedit
+
+            self.img_edit = imgedit.ImgEdit(workers=os.cpu_count() or 1)
+
+        return self.img_edit
+
+    def get_about_header(self):
+        """
+        Get the header image of the about window, loading it the first time it's displayed
+
+        Tk reads PNG files itself (since Tk 8.6), so we only need Pillow on older versions
+
+        :return: the `PhotoImage` (or `ImageTk` object) of the header
+        """
+
+        if self.about_header is None:
+            try:
+                self.about_header = PhotoImage(file="about_header.png")
+            except TclError:
+                import imgedit
+
+                self.about_header = imgedit.HelpingMethods.get_imagetk("about_header.png")
+
+        return self.about_header
+
     def display_about(self):
         """
         Display the about window (with a scrollbar)
@@ -163,7 +530,7 @@ class Application(Frame):
         self.about_window.iconbitmap("icon.ico")
 
         # Header
-        header_imagetk = imgedit.HelpingMethods.get_imagetk("about_header.png")
+        header_imagetk = self.get_about_header()
 
         header_label = Label(self.about_window, width=400, height=150)
         header_label.pack(side="top", fill="both")
@@ -242,6 +609,8 @@ class Application(Frame):
         The handler of the Export button
         """
 
+        from tkinter import messagebox
+
         settings_status = self.get_settings_status()
 
         if settings_status is not SettingsStatus.valid_settings:
@@ -269,7 +638,7 @@ class Application(Frame):
                 # call `ImgEdit.export_all_in_dir` as the target of a new thread
                 # and put the final result in a `Queue`
                 q = queue.Queue()
-                my_thread = threading.Thread(target=self.img_edit.export_all_in_dir,
+                my_thread = threading.Thread(target=self.get_img_edit().export_all_in_dir,
                                              args=(self.selected_directory.get(),
                                                    int(self.export_properties["width"].get()),
                                                    int(self.export_properties["height"].get()),
@@ -286,6 +655,8 @@ class Application(Frame):
         Gets called when we click the Browse button
         """
 
+        from tkinter import filedialog
+
         self.selected_directory.set(filedialog.askdirectory())
 
     def toggle_save_as_dropdown(self):
@@ -301,6 +672,43 @@ class Application(Frame):
         else:
             self.save_as_dropdown.configure(state="enabled")
 
+    def toggle_preview(self):
+        """
+        Show or hide the preview grid (below the settings, making the window taller)
+        Gets called when we click the Show preview checkbox
+        """
+
+        if self.show_preview.get():
+            if self.preview_grid is None:
+                self.preview_grid = PreviewGrid(self)
+            self.preview_grid.grid(row=1, column=0, sticky="nsew", padx=10, pady=(0, 10))
+            self.master.geometry("360x560")
+            self.update_preview()
+        else:
+            if self.preview_grid is not None:
+                self.preview_grid.grid_remove()
+            self.master.geometry("360x210")
+
+    def update_preview(self):
+        """
+        Show the selected directory in the preview grid (if it's shown and the directory exists)
+        """
+
+        self.preview_update_id = None
+        selected_directory = self.selected_directory.get()
+        if self.show_preview.get() and os.path.isdir(selected_directory):
+            self.preview_grid.set_directory(selected_directory)
+
+    def selected_directory_changed(self, *args):
+        """
+        Update the preview a moment after the selected directory changes (so we don't scan
+        every directory on the way while a path is typed)
+        """
+
+        if self.preview_update_id is not None:
+            self.after_cancel(self.preview_update_id)
+        self.preview_update_id = self.after(300, self.update_preview)
+
     def clear_entry(self, e):
         """
         Clear the entry (gets called when an entry is focused)
@@ -354,7 +762,8 @@ class Application(Frame):
                                                self.export_properties["type"],
                                                self.export_properties["type"].get(),
                                                "PNG",
-                                               "JPEG")
+                                               "JPEG",
+                                               "WEBP")
         self.save_as_dropdown.grid(row=3, column=1, sticky="we", padx=2)
 
         # Overwrite original
@@ -364,7 +773,16 @@ class Application(Frame):
                         onvalue=True,
                         offvalue=False,
                         command=self.toggle_save_as_dropdown).grid(
-            row=4, column=0, columnspan=2, sticky="w")
+            row=4, column=0, sticky="w")
+
+        # Preview
+        ttk.Checkbutton(main_container,
+                        text="Show preview",
+                        variable=self.show_preview,
+                        onvalue=True,
+                        offvalue=False,
+                        command=self.toggle_preview).grid(
+            row=4, column=1, sticky="w")
 
         # Export
         ttk.Button(main_container, text="Export", command=self.export_button_handler).grid(
@@ -391,11 +809,18 @@ class Application(Frame):
         self.save_as_dropdown = None
         self.progress_window = None
         self.progress_bar = None
-
-        self.img_edit = imgedit.ImgEdit()
+        self.pause_button = None
+        self.cancel_button = None
+        self.img_edit = None
+        self.about_header = None
+        self.preview_grid = None
+        self.preview_update_id = None
 
         self.selected_directory = StringVar(self)
+        self.progress_text = StringVar(self)
+        self.failure_text = StringVar(self)
         self.overwrite_original = BooleanVar(self)
+        self.show_preview = BooleanVar(self)
         self.export_properties = {
             "width": StringVar(self),
             "height": StringVar(self),
@@ -406,13 +831,47 @@ class Application(Frame):
         self.grid()
         self.set_properties_defaults()
         self.create_widgets()
+        self.selected_directory.trace_add("write", self.selected_directory_changed)
+
+
+def report_startup_time(root, filename):
+    """
+    Report how long the startup took, once the window is displayed, and close it
+
+    This is what `--startup-time [FILE]` does, to track the startup time between releases
+
+    :param root: The `Tk` root window
+    :param filename: The file to append the report to, as a line of JSON, or "-" for stdout
+    """
+
+    root.update()
+    report = json.dumps({
+        "seconds": round(time.perf_counter() - start_time, 4),
+        "frozen": bool(getattr(sys, "frozen", False)),
+        "pil_loaded": "PIL.Image" in sys.modules,
+        "modules": len(sys.modules)
+    })
+
+    if filename == "-":
+        print(report, flush=True)
+    else:
+        with open(filename, "a") as f:
+            f.write(report + "\n")
+
+    root.destroy()
 
 
 def main():
     """
     The main function
+
+    With `--startup-time [FILE]`, the time it took to display the window is reported
+    (see `report_startup_time()`) and the application exits
     """
 
+    # the worker processes of the export pool need this in the frozen executable
+    multiprocessing.freeze_support()
+
     root = Tk()
 
     root.title("Batch Image Resize")
@@ -424,6 +883,11 @@ def main():
     style.theme_use("vista")
 
     app = Application(parent=root)
+
+    if "--startup-time" in sys.argv[1:]:
+        args = sys.argv[sys.argv.index("--startup-time") + 1:]
+        root.after_idle(report_startup_time, root, args[0] if args else "-")
+
     app.mainloop()
 
 
@@ -0,0 +1,448 @@
+#! /usr/bin/python3
+
+# Batch Image Resize - command line interface
+# Copyright (c) 2016 over-engineer
+# https://github.com/over-engineer/Batch-Image-Resize
+
+import imgedit
+import workqueue
+
+import PIL.ImageColor
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+
+class JobError(Exception):
+    """
+    Raised when a job (given on the command line or in a job file) is invalid
+    """
+
+
+class CommandLine(object):
+    # the file types we export to
+    export_types = ["PNG", "JPEG", "WEBP"]
+
+    # the settings of a job, and their default values
+    job_defaults = {
+        "directory": None,
+        "width": None,
+        "height": None,
+        "type": "PNG",
+        "overwrite": False,
+        "workers": 1,
+        "incremental": False,
+        "fast_downscale": True,
+        "renditions": None,
+        "metrics": False,
+        "resize_mode": "exact",
+        "prefetch_depth": 0,
+        "write_behind_depth": 0,
+        "io_memory_budget_mb": 256,
+        "memory_budget_mb": None,
+        "batch_size": 0,
+        "profile": None,
+        "dedup": False,
+        "dedup_hardlinks": False,
+        "journal": False,
+        "resume": False,
+        "work_queue": None,
+        "unit_size": 50,
+        "include": None,
+        "exclude": None,
+        "max_depth": None,
+        "skip_outputs": True,
+        "sniff": False,
+        "background": "white",
+        "exif_transpose": True,
+        "srgb": False
+    }
+
+    @staticmethod
+    def parse_rendition(rendition):
+        """
+        Parse a rendition given on the command line
+
+        :param rendition: The rendition as a "WIDTHxHEIGHT:TYPE:SUFFIX" string (e.g. "200x150:JPEG:_thumb")
+        :return: The `imgedit.Rendition` tuple
+        """
+
+        try:
+            size, export_type, suffix = rendition.split(":")
+            width, height = size.lower().split("x")
+            return imgedit.Rendition(int(width), int(height), export_type.upper(), suffix)
+        except ValueError:
+            raise argparse.ArgumentTypeError("invalid rendition \"" + rendition + "\" (expected WIDTHxHEIGHT:TYPE:SUFFIX)")
+
+    @staticmethod
+    def load_job_file(filename):
+        """
+        Load a JSON or YAML job file
+
+        The file contains either a list of jobs, or an object with a "jobs" list. Each job is an object
+        with the keys of `CommandLine.job_defaults` (e.g. {"directory": "photos", "width": 800, "height": 600})
+
+        :param filename: The path to the job file (YAML is used for ".yml" and ".yaml" files)
+        :return: The list of jobs
+        """
+
+        with open(filename, "r") as f:
+            if filename.lower().endswith((".yml", ".yaml")):
+                # PyYAML is only needed for YAML job files
+                try:
+                    import yaml
+                except ImportError:
+                    raise JobError("PyYAML is required to read YAML job files (pip install PyYAML)")
+                jobs = yaml.safe_load(f)
+            else:
+                jobs = json.load(f)
+
+        if isinstance(jobs, dict):
+            jobs = jobs.get("jobs")
+        if not isinstance(jobs, list):
+            raise JobError("the job file must contain a list of jobs")
+
+        return jobs
+
+    def get_job(self, settings):
+        """
+        Validate the settings of a job and fill in the defaults
+
+        :param settings: A dict with the settings of the job
+        :return: A dict with all the keys of `CommandLine.job_defaults`
+        """
+
+        unknown_keys = set(settings) - set(self.job_defaults)
+        if unknown_keys:
+            raise JobError("unknown job settings: " + ", ".join(sorted(unknown_keys)))
+
+        job = dict(self.job_defaults)
+        job.update((key, value) for key, value in settings.items() if value is not None)
+
+        if job["directory"] is None or not os.path.isdir(job["directory"]):
+            raise JobError("the directory \"" + str(job["directory"]) + "\" does not exist")
+
+        if job["renditions"]:
+            job["renditions"] = [rendition if isinstance(rendition, imgedit.Rendition)
+                                 else imgedit.Rendition(int(rendition["width"]), int(rendition["height"]),
+                                                        rendition.get("type", "PNG").upper(),
+                                                        rendition["suffix"])
+                                 for rendition in job["renditions"]]
+            for rendition in job["renditions"]:
+                if rendition.export_type not in self.export_types:
+                    raise JobError("unknown rendition type \"" + str(rendition.export_type) + "\" (expected one of " +
+                                   ", ".join(self.export_types) + ")")
+        elif not isinstance(job["width"], int) or not isinstance(job["height"], int) or \
+                job["width"] <= 0 or job["height"] <= 0:
+            raise JobError("width and height must be positive integers")
+
+        try:
+            job["resize_mode"] = imgedit.ResizeMode(job["resize_mode"])
+        except ValueError:
+            raise JobError("unknown resize mode \"" + str(job["resize_mode"]) + "\"")
+
+        if job["profile"] is not None and job["profile"] not in imgedit.ImgEdit.export_profiles:
+            raise JobError("unknown export profile \"" + str(job["profile"]) + "\"")
+
+        # a single pattern can be given as a string
+        for key in ("include", "exclude"):
+            if isinstance(job[key], str):
+                job[key] = [job[key]]
+
+        # a color name or "#rrggbb" string, or a list of RGB values in a job file
+        try:
+            if isinstance(job["background"], (list, tuple)):
+                job["background"] = tuple(int(value) for value in job["background"])[:3]
+            else:
+                job["background"] = PIL.ImageColor.getrgb(str(job["background"]))[:3]
+        except ValueError:
+            raise JobError("unknown background color \"" + str(job["background"]) + "\"")
+
+        # the same types `--type` accepts (the extension of the exported files comes from it)
+        job["type"] = str(job["type"]).upper()
+        if job["type"] not in self.export_types:
+            raise JobError("unknown type \"" + job["type"] + "\" (expected one of " +
+                           ", ".join(self.export_types) + ")")
+
+        return job
+
+    def print_event(self, event, **fields):
+        """
+        Print an event as a line of JSON
+
+        :param event: The name of the event (e.g. "progress")
+        :param fields: The fields of the event
+        """
+
+        fields["event"] = event
+        print(json.dumps(fields, sort_keys=True), file=self.output, flush=True)
+
+    def run_job(self, job_id, job):
+        """
+        Run a job and print its progress until it's done
+
+        :param job_id: The index of the job
+        :param job: The job dict (see `self.get_job()`)
+        :return: `True` if all images were exported successfully or `False` if there was an error
+        """
+
+        # print the stats of every image and a summary at the end of the job
+        metrics = None
+        if job["metrics"]:
+            metrics = imgedit.ExportMetrics(callback=lambda event: self.print_event(event.pop("event"),
+                                                                                   job=job_id, **event))
+
+        img_edit = imgedit.ImgEdit(workers=job["workers"],
+                                   fast_downscale=job["fast_downscale"],
+                                   incremental=job["incremental"],
+                                   renditions=job["renditions"],
+                                   metrics=metrics,
+                                   resize_mode=job["resize_mode"],
+                                   prefetch_depth=job["prefetch_depth"],
+                                   write_behind_depth=job["write_behind_depth"],
+                                   io_memory_budget=int(job["io_memory_budget_mb"] * 2 ** 20),
+                                   memory_budget=None if job["memory_budget_mb"] is None
+                                   else int(job["memory_budget_mb"] * 2 ** 20),
+                                   batch_size=job["batch_size"],
+                                   export_profile=job["profile"],
+                                   dedup=job["dedup"],
+                                   dedup_hardlinks=job["dedup_hardlinks"],
+                                   journal=job["journal"],
+                                   resume=job["resume"],
+                                   work_queue=None if job["work_queue"] is None
+                                   else workqueue.SQLiteWorkQueue(job["work_queue"]),
+                                   unit_size=job["unit_size"],
+                                   include=job["include"],
+                                   exclude=job["exclude"],
+                                   max_depth=job["max_depth"],
+                                   skip_outputs=job["skip_outputs"],
+                                   sniff_content=job["sniff"],
+                                   exif_transpose=job["exif_transpose"],
+                                   convert_to_srgb=job["srgb"],
+                                   background=job["background"])
+
+        self.print_event("job_started", job=job_id, directory=job["directory"])
+
+        q = queue.Queue()
+        start_time = time.monotonic()
+        export_thread = threading.Thread(target=img_edit.export_all_in_dir,
+                                         args=(job["directory"], job["width"], job["height"],
+                                               job["type"], job["overwrite"], q))
+        export_thread.daemon = True
+        export_thread.start()
+
+        # print the progress until the result is in the queue (Ctrl+C cancels the job,
+        # after the images that are being exported are finished)
+        result = None
+        scan_stats_printed = False
+        while result is None:
+            try:
+                result = q.get(timeout=self.interval)
+            except queue.Empty:
+                pass
+            except KeyboardInterrupt:
+                img_edit.progress.cancel()
+                self.print_event("job_cancelled", job=job_id)
+
+            # print the images that failed since the last progress event
+            for event in img_edit.progress.get_events():
+                self.print_event(event.pop("event"), job=job_id, **event)
+
+            # print the stats of the scan once it's over
+            scan_stats = img_edit.scan_stats
+            if scan_stats is not None and not scan_stats_printed:
+                self.print_event("scan_finished", job=job_id, **scan_stats)
+                scan_stats_printed = True
+
+            elapsed = time.monotonic() - start_time
+            status = img_edit.progress.get_status()
+            self.print_event("progress" if result is None else "job_finished",
+                             job=job_id,
+                             exported=img_edit.num_of_exported_images,
+                             total=img_edit.num_of_images_to_export,
+                             scan_finished=img_edit.scan_finished,
+                             skipped=img_edit.num_of_skipped_images,
+                             failed=img_edit.num_of_failed_images,
+                             deduplicated=img_edit.num_of_deduplicated_images,
+                             deduplicated_bytes=img_edit.num_of_deduplicated_bytes,
+                             cancelled=status["cancelled"],
+                             elapsed=round(elapsed, 3),
+                             images_per_sec=round(img_edit.num_of_exported_images / elapsed, 2) if elapsed else 0.0,
+                             smoothed_images_per_sec=None if status["images_per_sec"] is None
+                             else round(status["images_per_sec"], 2),
+                             bytes_per_sec=None if status["bytes_per_sec"] is None
+                             else round(status["bytes_per_sec"]),
+                             eta=None if status["eta"] is None else round(status["eta"], 1))
+
+        return result
+
+    def run_worker(self, database, lease_time):
+        """
+        Run as a worker of a work queue (see `ImgEdit.work()`) and print the images that failed
+
+        :param database: The path to the SQLite database of the work queue
+        :param lease_time: The number of seconds a work unit is leased for
+        :return: `True` if all the images were exported successfully or `False` if there was an error
+        """
+
+        img_edit = imgedit.ImgEdit()
+        self.print_event("worker_started", work_queue=database)
+
+        start_time = time.monotonic()
+        result = img_edit.work(workqueue.SQLiteWorkQueue(database), lease_time=lease_time, poll_interval=self.interval)
+
+        for path, reason in img_edit.failures:
+            self.print_event("image_failed", path=path, reason=reason)
+        self.print_event("worker_finished",
+                         exported=img_edit.num_of_exported_images,
+                         failed=img_edit.num_of_failed_images,
+                         elapsed=round(time.monotonic() - start_time, 3))
+        return result
+
+    def parse_args(self, args):
+        """
+        Parse the command line arguments
+
+        :param args: The list of arguments (without the program name)
+        :return: The `argparse.Namespace`
+        """
+
+        parser = argparse.ArgumentParser(prog="bir_cli",
+                                         description="Resize all the images in a directory, without the GUI. "
+                                                     "Progress is printed as one JSON object per line.")
+        parser.add_argument("directory", nargs="?", help="the directory containing the images to resize")
+        parser.add_argument("--width", type=int, help="the width to resize to")
+        parser.add_argument("--height", type=int, help="the height to resize to")
+        parser.add_argument("--type", choices=self.export_types, type=str.upper,
+                            help="the file type to save to (default is PNG)")
+        parser.add_argument("--profile", choices=sorted(imgedit.ImgEdit.export_profiles),
+                            help="the encoder settings, from the fastest to encode to the smallest files "
+                                 "(default is Pillow's settings)")
+        parser.add_argument("--resize-mode", choices=[resize_mode.value for resize_mode in imgedit.ResizeMode],
+                            help="how images are fitted to the width and height (default is exact)")
+        parser.add_argument("--overwrite", action="store_true", default=None, help="overwrite the original files")
+        parser.add_argument("--workers", type=int, help="the number of worker processes (default is 1)")
+        parser.add_argument("--incremental", action="store_true", default=None,
+                            help="skip the images that haven't changed since the last export")
+        parser.add_argument("--no-fast-downscale", dest="fast_downscale", action="store_false", default=None,
+                            help="always decode images at full resolution")
+        parser.add_argument("--rendition", dest="renditions", action="append", type=self.parse_rendition,
+                            metavar="WxH:TYPE:SUFFIX", help="export a rendition (can be given more than once)")
+        parser.add_argument("--metrics", action="store_true", default=None,
+                            help="print the time of each stage for every image and a summary")
+        parser.add_argument("--prefetch-depth", type=int,
+                            help="the number of images read ahead on a separate thread (single worker only)")
+        parser.add_argument("--write-behind-depth", type=int,
+                            help="the number of files written behind on a separate thread (single worker only)")
+        parser.add_argument("--io-memory-budget-mb", type=float,
+                            help="the memory for the read-ahead and write-behind in MB (default is 256)")
+        parser.add_argument("--memory-budget-mb", type=float,
+                            help="the memory the worker processes may use for decoding and resizing, in MB")
+        parser.add_argument("--batch-size", type=int,
+                            help="resize small images of the same size and mode in batches of this many (needs NumPy)")
+        parser.add_argument("--dedup", action="store_true", default=None,
+                            help="resize the images that have the same content only once, and copy the result")
+        parser.add_argument("--dedup-hardlinks", action="store_true", default=None,
+                            help="hard link the exported files of the duplicates instead of copying them")
+        parser.add_argument("--journal", action="store_true", default=None,
+                            help="keep a journal of the exported images, so an interrupted job can be resumed")
+        parser.add_argument("--resume", action="store_true", default=None,
+                            help="skip the images the last (interrupted) job recorded as exported in its journal")
+        parser.add_argument("--work-queue", metavar="DATABASE",
+                            help="coordinate workers through this SQLite work queue instead of exporting here")
+        parser.add_argument("--unit-size", type=int,
+                            help="the number of images in each work unit of the work queue (default is 50)")
+        parser.add_argument("--worker", metavar="DATABASE",
+                            help="run as a worker of the SQLite work queue of a coordinator, until its job is done")
+        parser.add_argument("--lease-time", type=float, default=60.0,
+                            help="the number of seconds a worker leases a work unit for (default is 60)")
+        parser.add_argument("--include", action="append", metavar="PATTERN",
+                            help="only export the images whose name or relative path matches this glob pattern "
+                                 "(can be given more than once)")
+        parser.add_argument("--exclude", action="append", metavar="PATTERN",
+                            help="skip the images and the directories whose name or relative path matches this "
+                                 "glob pattern (can be given more than once)")
+        parser.add_argument("--max-depth", type=int,
+                            help="the number of levels of subdirectories to scan (0 is only the directory itself)")
+        parser.add_argument("--no-skip-outputs", dest="skip_outputs", action="store_false", default=None,
+                            help="also export the files that look like the output of an export (e.g. *_resize.png)")
+        parser.add_argument("--sniff", action="store_true", default=None,
+                            help="also find images by their content, e.g. files without an extension")
+        parser.add_argument("--background", metavar="COLOR",
+                            help="the color to flatten transparent images onto when they are saved as JPEG, "
+                                 "a name or #rrggbb (default is white)")
+        parser.add_argument("--no-exif-transpose", dest="exif_transpose", action="store_false", default=None,
+                            help="don't rotate the images by their EXIF orientation")
+        parser.add_argument("--srgb", action="store_true", default=None,
+                            help="convert the colors of the images with an ICC profile to sRGB")
+        parser.add_argument("--job-file", help="a JSON or YAML file with a list of jobs to run")
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="the number of seconds between progress events (default is 1)")
+
+        parsed_args = parser.parse_args(args)
+        if [parsed_args.directory, parsed_args.job_file, parsed_args.worker].count(None) != 2:
+            parser.error("give either a directory, a --job-file or a --worker work queue")
+
+        return parsed_args
+
+    def main(self, args):
+        """
+        Run the jobs given on the command line
+
+        :param args: The list of arguments (without the program name)
+        :return:    The exit code: 0 if everything was exported successfully, 1 if any image
+                    failed to export, or 2 if a job is invalid
+        """
+
+        parsed_args = self.parse_args(args)
+        self.interval = parsed_args.interval
+
+        if parsed_args.worker is not None:
+            return 0 if self.run_worker(parsed_args.worker, parsed_args.lease_time) else 1
+
+        try:
+            if parsed_args.job_file is not None:
+                jobs = [self.get_job(settings) for settings in self.load_job_file(parsed_args.job_file)]
+            else:
+                jobs = [self.get_job({key: getattr(parsed_args, key, None) for key in self.job_defaults})]
+        except (JobError, IOError, ValueError, KeyError, TypeError) as e:
+            print("bir_cli: error: " + str(e), file=sys.stderr)
+            return 2
+
+        all_exported_successfully = True
+        for job_id, job in enumerate(jobs):
+            if not self.run_job(job_id, job):
+                all_exported_successfully = False
+
+        return 0 if all_exported_successfully else 1
+
+    def __init__(self, output=sys.stdout):
+        """
+        The constructor of the CommandLine class
+
+        :param output: The file the progress events are printed to
+        """
+
+        self.output = output
+        self.interval = 1.0
+
+
+def main():
+    """
+    The main function
+    """
+
+    # the worker processes of the export pool need this in the frozen executable
+    multiprocessing.freeze_support()
+
+    sys.exit(CommandLine().main(sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#! /usr/bin/python3
+
+# Batch Image Resize - scanner module
+# Copyright (c) 2016 over-engineer
+# https://github.com/over-engineer/Batch-Image-Resize
+
+import fnmatch
+import os
+import re
+import time
+
+
+class DirectoryScanner(object):
+    """
+    Find the images in a directory tree with `os.scandir`
+
+    The tree is walked depth first with one open `os.scandir` iterator for each level we are in,
+    so the memory we use doesn't grow with the number of files (or subdirectories) of a directory.
+    Images are picked by their extension, or (optionally) by sniffing the first bytes of the other files
+    """
+
+    # the extensions of the images we export
+    extensions = {".png", ".jpg", ".jpeg", ".webp"}
+
+    # the first bytes of the files of each image type, for sniffing
+    signatures = [
+        (0, b"\x89PNG\r\n\x1a\n"),
+        (0, b"\xff\xd8\xff"),
+        (8, b"WEBP")
+    ]
+
+    @staticmethod
+    def compile_patterns(patterns):
+        """
+        Compile glob patterns into a single regular expression
+
+        :param patterns: A list of glob patterns (e.g. ["*.png", "raw/*"]), or `None`
+        :return: The compiled regular expression, or `None` if there are no patterns
+        """
+
+        if not patterns:
+            return None
+
+        return re.compile("|".join("(?:" + fnmatch.translate(os.path.normcase(pattern)) + ")"
+                                   for pattern in patterns))
+
+    @classmethod
+    def sniff(cls, path):
+        """
+        Check if a file is an image by its first bytes
+
+        :param path: The path to the file
+        :return: `True` if the file starts like a PNG, JPEG or WebP file
+        """
+
+        try:
+            with open(path, "rb") as f:
+                head = f.read(16)
+        except OSError:
+            return False
+
+        return any(head[offset:offset + len(signature)] == signature for offset, signature in cls.signatures)
+
+    def matches(self, pattern, rel_path, name):
+        """
+        Check if a file or a directory matches a compiled pattern, by its relative path or its name
+
+        :param pattern: The compiled pattern (see `self.compile_patterns()`)
+        :param rel_path: The path relative to the top directory (with "/" separators)
+        :param name: The name of the file or the directory
+        :return: `True` if it matches
+        """
+
+        return pattern.match(os.path.normcase(rel_path)) is not None or \
+            pattern.match(os.path.normcase(name)) is not None
+
+    def is_output(self, name):
+        """
+        Check if a file is one of our exported images (e.g. "image_resize.png")
+
+        :param name: The name of the file
+        :return: `True` if its name (without the extension) ends with one of `self.output_suffixes`
+        """
+
+        return bool(self.output_suffixes) and os.path.splitext(name)[0].endswith(self.output_suffixes)
+
+    def scan(self, top):
+        """
+        Walk a directory tree and yield the images in it
+
+        :param top: The path to the directory
+        :return: A generator of `(path, entry)` tuples, where `path` is the directory of the image
+                 and `entry` its `os.DirEntry` (with its cached stat results)
+        """
+
+        self.num_of_entries = 0
+        self.num_of_dirs = 0
+        self.num_of_images = 0
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+        # a stack of (path of the directory, path relative to the top, depth, scandir iterator)
+        stack = [(top, "", 0, os.scandir(top))]
+        self.num_of_dirs += 1
+        try:
+            while stack:
+                path, rel_dir, depth, entries = stack[-1]
+                entry = next(entries, None)
+                if entry is None:
+                    entries.close()
+                    stack.pop()
+                    continue
+
+                self.num_of_entries += 1
+                rel_path = rel_dir + entry.name
+
+                try:
+                    is_dir = entry.is_dir()
+                    # like `os.walk`, we don't follow the links to directories (they can loop, or lead out
+                    # of the directory we were given)
+                    if is_dir and entry.is_symlink():
+                        continue
+                except OSError:
+                    continue
+
+                if is_dir:
+                    if self.max_depth is not None and depth >= self.max_depth:
+                        continue
+                    if self.exclude is not None and self.matches(self.exclude, rel_path, entry.name):
+                        continue
+                    try:
+                        stack.append((entry.path, rel_path + "/", depth + 1, os.scandir(entry.path)))
+                        self.num_of_dirs += 1
+                    except OSError:
+                        pass
+                    continue
+
+                if os.path.splitext(entry.name)[1].lower() not in self.extensions and \
+                        not (self.sniff_content and self.sniff(entry.path)):
+                    continue
+                if self.skip_outputs and self.is_output(entry.name):
+                    continue
+                if self.include is not None and not self.matches(self.include, rel_path, entry.name):
+                    continue
+                if self.exclude is not None and self.matches(self.exclude, rel_path, entry.name):
+                    continue
+
+                self.num_of_images += 1
+                yield path, entry
+        finally:
+            for path, rel_dir, depth, entries in stack:
+                entries.close()
+            self.end_time = time.perf_counter()
+
+    def get_stats(self):
+        """
+        Get the stats of the (last) scan
+
+        :return: A dict with the number of entries, directories and images found, the time it took
+                 and the number of entries scanned per second
+        """
+
+        seconds = (self.end_time or time.perf_counter()) - self.start_time if self.start_time else 0.0
+        return {
+            "entries": self.num_of_entries,
+            "dirs": self.num_of_dirs,
+            "images": self.num_of_images,
+            "seconds": round(seconds, 3),
+            "entries_per_sec": round(self.num_of_entries / seconds, 1) if seconds else None
+        }
+
+    def __init__(self, include=None, exclude=None, max_depth=None, output_suffixes=("_resize",),
+                 skip_outputs=True, sniff_content=False):
+        """
+        The constructor of the DirectoryScanner class
+
+        :param include: Glob patterns of the images to scan (matched against their name or their
+                        path relative to the top directory), or `None` to scan all of them
+        :param exclude: Glob patterns of the images and the directories to skip, or `None`
+        :param max_depth: The number of levels of subdirectories to scan (0 is only the top directory),
+                          or `None` for all of them
+        :param output_suffixes: The suffixes of the names of our exported images (default is ("_resize",))
+        :param skip_outputs: Whether to skip our exported images (default is `True`)
+        :param sniff_content: Whether to check the first bytes of the files that don't have the extension
+                              of an image, so images without an extension (or with a wrong one) are found too
+        """
+
+        self.include = self.compile_patterns(include)
+        self.exclude = self.compile_patterns(exclude)
+        self.max_depth = max_depth
+        self.output_suffixes = tuple(suffix for suffix in output_suffixes if suffix)
+        self.skip_outputs = skip_outputs
+        self.sniff_content = sniff_content
+        self.num_of_entries = 0
+        self.num_of_dirs = 0
+        self.num_of_images = 0
+        self.start_time = None
+        self.end_time = None
@@ -7,5 +7,11 @@ setup(
             "script": "bir.py",
             "icon_resources": [(1, "icon.ico")]
         }
+    ],
+    console=[
+        {
+            "script": "bir_cli.py",
+            "icon_resources": [(1, "icon.ico")]
+        }
     ]
 )
@@ -0,0 +1,306 @@
+#! /usr/bin/python3
+
+# Batch Image Resize - thumbnails module
+# Copyright (c) 2016 over-engineer
+# https://github.com/over-engineer/Batch-Image-Resize
+
+import collections
+import concurrent.futures
+import hashlib
+import io
+import os
+import queue
+import re
+import threading
+import PIL.Image
+
+from imgedit import HelpingMethods, ImgEdit
+
+
+class ThumbnailCache(object):
+    """
+    An on-disk cache of thumbnails, with a limit on its size (the least recently used thumbnails go first)
+
+    A thumbnail is keyed by the path and the modification time of its image, so a changed image gets a
+    new thumbnail. The thumbnails are PNG files named after their key and the size of their image (e.g.
+    "<key>_4000x3000.png"), so looking one up only takes the in-memory index. The modification time of
+    a thumbnail is its last use, so the order of the LRU survives a restart
+    """
+
+    # the names of the thumbnail files
+    filename_pattern = re.compile(r"^([0-9a-f]{40})_(\d+)x(\d+)\.png$")
+
+    @staticmethod
+    def get_default_directory():
+        """
+        Get the directory the thumbnails are cached in by default
+
+        :return: The path to "thumbnails" in the local application data (on Windows) or the user's cache
+        """
+
+        base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or \
+            os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(base, "Batch Image Resize", "thumbnails")
+
+    def get_key(self, img_path, mtime_ns):
+        """
+        Get the key of the thumbnail of an image
+
+        :param img_path: The path to the image
+        :param mtime_ns: The modification time of the image in nanoseconds
+        :return: The key (a hex string)
+        """
+
+        return hashlib.sha1(("%s|%d|%dx%d" % ((os.path.abspath(img_path), mtime_ns) + self.size))
+                            .encode("utf-8", "surrogateescape")).hexdigest()
+
+    def load(self):
+        """
+        Load the index of the thumbnails in the cache directory (the least recently used first)
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        thumbnails = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                match = self.filename_pattern.match(entry.name)
+                if match is None:
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                thumbnails.append((stat.st_mtime_ns, match.group(1), entry.name, stat.st_size))
+
+        with self.lock:
+            self.index.clear()
+            self.num_of_bytes = 0
+            for mtime_ns, key, name, size in sorted(thumbnails):
+                self.index[key] = (name, size)
+                self.num_of_bytes += size
+
+    def get(self, img_path, mtime_ns):
+        """
+        Look up the thumbnail of an image, and mark it as used
+
+        :param img_path: The path to the image
+        :param mtime_ns: The modification time of the image in nanoseconds
+        :return: A `(thumbnail path, (width, height) of the image)` tuple, or `None` if it isn't cached
+        """
+
+        key = self.get_key(img_path, mtime_ns)
+        with self.lock:
+            thumbnail = self.index.get(key)
+            if thumbnail is None:
+                return None
+            self.index.move_to_end(key)
+
+        thumbnail_path = os.path.join(self.directory, thumbnail[0])
+        try:
+            os.utime(thumbnail_path)
+        except OSError:
+            # it was deleted behind our back
+            with self.lock:
+                if self.index.pop(key, None) is not None:
+                    self.num_of_bytes -= thumbnail[1]
+            return None
+
+        match = self.filename_pattern.match(thumbnail[0])
+        return thumbnail_path, (int(match.group(2)), int(match.group(3)))
+
+    def put(self, img_path, mtime_ns, img_size, data):
+        """
+        Add the thumbnail of an image, removing the least recently used ones if the cache gets too large
+
+        :param img_path: The path to the image
+        :param mtime_ns: The modification time of the image in nanoseconds
+        :param img_size: The (width, height) of the image
+        :param data: The content of the PNG file of the thumbnail
+        :return: The path to the thumbnail
+        """
+
+        key = self.get_key(img_path, mtime_ns)
+        name = "%s_%dx%d.png" % ((key,) + tuple(img_size))
+        thumbnail_path = os.path.join(self.directory, name)
+        HelpingMethods.write_file(thumbnail_path, lambda f: f.write(data))
+
+        with self.lock:
+            old_thumbnail = self.index.pop(key, None)
+            if old_thumbnail is not None:
+                self.num_of_bytes -= old_thumbnail[1]
+            self.index[key] = (name, len(data))
+            self.num_of_bytes += len(data)
+
+            # keep some room, so we don't evict on every new thumbnail once the cache is full
+            evicted = []
+            if self.num_of_bytes > self.max_bytes:
+                while self.index and self.num_of_bytes > self.max_bytes * 0.9:
+                    evicted_key, (evicted_name, evicted_size) = self.index.popitem(last=False)
+                    self.num_of_bytes -= evicted_size
+                    evicted.append(evicted_name)
+
+        for evicted_name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, evicted_name))
+            except OSError:
+                pass
+
+        return thumbnail_path
+
+    def __init__(self, directory=None, max_bytes=256 * 2 ** 20, size=(96, 96)):
+        """
+        The constructor of the ThumbnailCache class
+
+        :param directory: The directory to keep the thumbnails in (default is `self.get_default_directory()`)
+        :param max_bytes: The maximum size of the thumbnails in bytes (default is 256 MB)
+        :param size: The (width, height) the thumbnails fit in (default is (96, 96))
+        """
+
+        self.directory = directory if directory is not None else self.get_default_directory()
+        self.max_bytes = max_bytes
+        self.size = tuple(size)
+        self.index = collections.OrderedDict()
+        self.num_of_bytes = 0
+        self.lock = threading.Lock()
+        self.load()
+
+
+class ThumbnailLoader(object):
+    """
+    Makes the thumbnails of images on a background pool of threads (Pillow lets go of the GIL while it decodes
+    and resizes), and keeps them in a `ThumbnailCache`
+
+    The grid asks for the thumbnails of the images it shows with `self.request()`, each time it scrolls. The
+    cached ones are returned right away, the others are queued, and the ones that are no longer shown and
+    haven't been started are dropped. The finished thumbnails are taken with `self.get_finished()`
+    """
+
+    def make_thumbnail(self, img_path):
+        """
+        Make the thumbnail of an image (runs on the pool), decoding it at a reduced size when we can
+
+        :param img_path: The path to the image
+        :return: A `(data of the PNG file, (width, height) of the image)` tuple
+        """
+
+        with PIL.Image.open(img_path) as img:
+            img_size = img.size
+
+            # `thumbnail()` decodes JPEG images at a reduced size (see `ImgEdit.reducing_gap`)
+            img.thumbnail(self.cache.size, PIL.Image.BICUBIC, reducing_gap=ImgEdit.reducing_gap)
+            if img.mode not in ("1", "L", "LA", "RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+
+            data = io.BytesIO()
+            img.save(data, "PNG")
+
+        return data.getvalue(), img_size
+
+    def load(self, img_path, mtime_ns):
+        """
+        Make the thumbnail of an image and cache it (runs on the pool)
+
+        :param img_path: The path to the image
+        :param mtime_ns: The modification time of the image in nanoseconds
+        :return: A `(thumbnail path, (width, height) of the image)` tuple, or `None` if the image can't be read
+        """
+
+        # any error (e.g. a `PIL.Image.DecompressionBombError` for a huge image) marks the image as
+        # unreadable, instead of being raised by `self.get_finished()` on the thread of the GUI
+        try:
+            data, img_size = self.make_thumbnail(img_path)
+            return self.cache.put(img_path, mtime_ns, img_size, data), img_size
+        except Exception:
+            return None
+
+    def request(self, images):
+        """
+        Ask for the thumbnails of the images that are shown
+
+        :param images: A list of `(path, mtime_ns)` tuples of the images
+        :return: A list of `(path, thumbnail)` tuples of the ones that were cached, where the thumbnail is
+                 a `(thumbnail path, (width, height) of the image)` tuple (see `ThumbnailCache.get()`)
+        """
+
+        cached = []
+        requested = set()
+        for img_path, mtime_ns in images:
+            requested.add(img_path)
+            if img_path in self.pending:
+                continue
+
+            thumbnail = self.cache.get(img_path, mtime_ns)
+            if thumbnail is not None:
+                cached.append((img_path, thumbnail))
+                continue
+
+            future = self.executor.submit(self.load, img_path, mtime_ns)
+            self.pending[img_path] = future
+            future.add_done_callback(lambda future, img_path=img_path: self.loaded(img_path, future))
+
+        # drop the thumbnails of the images that were scrolled away (unless they are being made already)
+        for img_path, future in list(self.pending.items()):
+            if img_path not in requested and future.cancel():
+                del self.pending[img_path]
+
+        return cached
+
+    def loaded(self, img_path, future):
+        """
+        Put a finished thumbnail in `self.finished` (called on the thread of the pool)
+
+        :param img_path: The path to the image
+        :param future: The `Future` of `self.load()`
+        """
+
+        if not future.cancelled():
+            self.finished.put((img_path, future))
+
+    def get_finished(self):
+        """
+        Get the thumbnails that were made since the last call
+
+        :return: A list of `(path, thumbnail)` tuples, where the thumbnail is a `(thumbnail path, (width, height)
+                 of the image)` tuple, or `None` if the image couldn't be read
+        """
+
+        finished = []
+        while True:
+            try:
+                img_path, future = self.finished.get_nowait()
+            except queue.Empty:
+                return finished
+
+            # the image may have been requested again after this one finished
+            if self.pending.get(img_path) is future:
+                del self.pending[img_path]
+            finished.append((img_path, future.result()))
+
+    def clear(self):
+        """
+        Drop all the thumbnails that haven't been started (e.g. when another directory is selected)
+        """
+
+        self.request([])
+
+    def close(self):
+        """
+        Stop the pool (the thumbnails that are being made are finished)
+        """
+
+        self.clear()
+        self.executor.shutdown(wait=False)
+
+    def __init__(self, cache, workers=None):
+        """
+        The constructor of the ThumbnailLoader class
+
+        :param cache: The `ThumbnailCache`
+        :param workers: The number of threads that make thumbnails (default is the number of CPUs)
+        """
+
+        self.cache = cache
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.pending = {}
+        self.finished = queue.Queue()
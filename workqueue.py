@@ -0,0 +1,275 @@
+#! /usr/bin/python3
+
+# Batch Image Resize - workqueue module
+# Copyright (c) 2016 over-engineer
+# https://github.com/over-engineer/Batch-Image-Resize
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class WorkQueue(object):
+    """
+    The transport between a coordinator and its workers (see `ImgEdit.export_all_in_dir()` and `ImgEdit.work()`)
+
+    The coordinator starts a job, adds the scanned images to it in work units and closes it once the scan
+    is over. Workers lease a unit, export its images and complete it with their results, renewing the
+    lease while they work. A unit whose lease expires (e.g. its worker died) can be leased by another
+    worker, until it has been leased `max_attempts` times, after which it fails. The coordinator
+    collects the results of the finished units
+
+    This is the interface a backend implements, `SQLiteWorkQueue` is the default one
+    """
+
+    def start_job(self, job):
+        """
+        Start a new job, dropping the units of the previous one
+
+        :param job: A dict with the export arguments and settings of the job (it has to be JSON serializable)
+        """
+
+        raise NotImplementedError
+
+    def add_unit(self, items):
+        """
+        Add a work unit to the job
+
+        :param items: A list of `{"path": ..., "name": ...}` dicts of the images to export
+        """
+
+        raise NotImplementedError
+
+    def close_job(self):
+        """
+        Mark that no more units will be added to the job (so workers can stop once it's done)
+        """
+
+        raise NotImplementedError
+
+    def cancel_job(self):
+        """
+        Drop the units that haven't been leased yet, cancel the leased ones and close the job
+
+        The workers of the cancelled units stop once the image they are exporting is done (their next
+        `renew_lease()` fails) and the results of those units are dropped, so the job is finished right away
+        """
+
+        raise NotImplementedError
+
+    def lease_unit(self, worker_id, lease_time):
+        """
+        Lease a pending unit (or one whose lease has expired)
+
+        :param worker_id: The id of the worker
+        :param lease_time: The number of seconds the lease lasts, unless it's renewed
+        :return: A `(unit_id, job, items)` tuple, or `None` if there is no unit to lease right now
+        """
+
+        raise NotImplementedError
+
+    def renew_lease(self, unit_id, worker_id, lease_time):
+        """
+        Extend the lease of a unit
+
+        :param unit_id: The id of the unit
+        :param worker_id: The id of the worker
+        :param lease_time: The number of seconds the lease lasts from now
+        :return: `True` if the worker still holds the lease, or `False` if it expired and was lost
+        """
+
+        raise NotImplementedError
+
+    def complete_unit(self, unit_id, worker_id, results):
+        """
+        Complete a unit with the results of its images
+
+        :param unit_id: The id of the unit
+        :param worker_id: The id of the worker
+        :param results: A list with `True` or the reason of the failure (a string) for each image of the unit
+        """
+
+        raise NotImplementedError
+
+    def collect_units(self):
+        """
+        Get the units that finished since the last call (this is the coordinator side)
+
+        :return: A list of `(items, results)` tuples
+        """
+
+        raise NotImplementedError
+
+    def is_finished(self):
+        """
+        Check if the job is closed and all its units finished
+
+        :return: `True` if there is nothing left to do
+        """
+
+        raise NotImplementedError
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    A work queue in a SQLite database, for workers on the same machine or on a file system that
+    supports SQLite's locking (the leases also assume the clocks of the machines are in sync)
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            job TEXT NOT NULL,
+            closed INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS units (
+            id INTEGER PRIMARY KEY,
+            items TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            results TEXT,
+            collected INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS units_status ON units (status, collected);
+    """
+
+    def get_connection(self):
+        """
+        Get the connection to the database (it's opened on first use, in each process)
+
+        :return: The `sqlite3.Connection`
+        """
+
+        if self.connection is None:
+            # we manage the transactions ourselves, so a lease is taken atomically
+            self.connection = sqlite3.connect(self.filename, timeout=self.timeout, isolation_level=None,
+                                              check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(self.schema)
+
+        return self.connection
+
+    def execute(self, *statements):
+        """
+        Run SQL statements in a single (write) transaction
+
+        :param statements: `(sql, parameters)` tuples
+        :return: The rows of the last statement
+        """
+
+        with self.lock:
+            connection = self.get_connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, parameters in statements:
+                    rows = connection.execute(sql, parameters).fetchall()
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+        return rows
+
+    def start_job(self, job):
+        self.execute(("DELETE FROM units", ()),
+                     ("DELETE FROM jobs", ()),
+                     ("INSERT INTO jobs (job) VALUES (?)", (json.dumps(job),)))
+
+    def add_unit(self, items):
+        self.execute(("INSERT INTO units (items) VALUES (?)", (json.dumps(items),)))
+
+    def close_job(self):
+        self.execute(("UPDATE jobs SET closed = 1", ()))
+
+    def cancel_job(self):
+        self.execute(("DELETE FROM units WHERE status = 'pending'", ()),
+                     ("UPDATE units SET status = 'cancelled' WHERE status = 'leased'", ()),
+                     ("UPDATE jobs SET closed = 1", ()))
+
+    def lease_unit(self, worker_id, lease_time):
+        with self.lock:
+            connection = self.get_connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+
+                # the units that were leased too many times fail
+                rows = connection.execute("SELECT id, items, attempts FROM units WHERE status = 'leased' "
+                                          "AND lease_expires < ? AND attempts >= ?",
+                                          (now, self.max_attempts)).fetchall()
+                for unit_id, items, attempts in rows:
+                    reason = "the lease of its work unit expired %d times" % attempts
+                    connection.execute("UPDATE units SET status = 'done', results = ? WHERE id = ?",
+                                       (json.dumps([reason] * len(json.loads(items))), unit_id))
+
+                row = connection.execute("SELECT id, items FROM units WHERE status = 'pending' "
+                                         "OR (status = 'leased' AND lease_expires < ?) "
+                                         "ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, "
+                                       "attempts = attempts + 1 WHERE id = ?", (worker_id, now + lease_time, row[0]))
+                    job = connection.execute("SELECT job FROM jobs").fetchone()[0]
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        return row[0], json.loads(job), json.loads(row[1])
+
+    def renew_lease(self, unit_id, worker_id, lease_time):
+        rows = self.execute(("UPDATE units SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                             (time.time() + lease_time, unit_id, worker_id)),
+                            ("SELECT changes()", ()))
+        return rows[0][0] > 0
+
+    def complete_unit(self, unit_id, worker_id, results):
+        # a worker that lost its lease may still finish, in which case the first one to finish wins
+        self.execute(("UPDATE units SET status = 'done', results = ? WHERE id = ? AND status = 'leased'",
+                      (json.dumps(results), unit_id)))
+
+    def collect_units(self):
+        rows = self.execute(("SELECT id, items, results FROM units WHERE status = 'done' AND collected = 0", ()))
+        if rows:
+            self.execute(*[("UPDATE units SET collected = 1 WHERE id = ?", (row[0],)) for row in rows])
+
+        return [(json.loads(items), json.loads(results)) for unit_id, items, results in rows]
+
+    def is_finished(self):
+        rows = self.execute(("SELECT (SELECT closed FROM jobs), "
+                             "(SELECT COUNT(*) FROM units WHERE status NOT IN ('done', 'cancelled'))", ()))
+        closed, unfinished = rows[0]
+        return bool(closed) and unfinished == 0
+
+    def __getstate__(self):
+        """
+        Get the state that is pickled (each process opens its own connection)
+        """
+
+        state = self.__dict__.copy()
+        state["connection"] = None
+        state["lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __init__(self, filename, max_attempts=3, timeout=30.0):
+        """
+        The constructor of the SQLiteWorkQueue class
+
+        :param filename: The path to the database file (it's created if it doesn't exist)
+        :param max_attempts: The number of times a unit can be leased before it fails (default is 3)
+        :param timeout: The number of seconds to wait for the database while another process writes to it
+        """
+
+        self.filename = filename
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.connection = None
+        self.lock = threading.Lock()